@@ -40,10 +40,10 @@ class LogProgress(Callback):
 
     def __call__(self, algo,  i, max_iter):
         if (i % self.every == 0):
-            variables_data = algo.get_variables_data(self.ids)
+            columns = algo.get_variables_columns(self.ids)
             logger.info(f"iteration={i+1}/{max_iter}")
-            for variable_id, data in variables_data.items():
-                logger.info(f"id={variable_id} v={data['v']:.3f}")
+            for variable_id, v in zip(columns["id"], columns["v"]):
+                logger.info(f"id={variable_id} v={v:.3f}")
 
 
 class TrackMessages(Callback):
@@ -97,9 +97,9 @@ class TrackEvolution(Callback):
         if (i == 0):
             self.records = []
         if (i % self.every == 0):
-            variables_data = algo.get_variables_data(self.ids)
-            for variable_id, data in variables_data.items():
-                record = dict(id=variable_id, v=data["v"], iter=i)
+            columns = algo.get_variables_columns(self.ids)
+            for variable_id, v in zip(columns["id"], columns["v"].tolist()):
+                record = dict(id=variable_id, v=v, iter=i)
                 self.records.append(record)
                 if self.verbose:
                     print(record)
@@ -206,41 +206,35 @@ class EarlyStopping(Callback):
     def __call__(self, algo,  i, max_iter):
         if (i == 0):
             self.old_vs = None
-        variables_data = algo.get_variables_data(self.ids)
-        new_vs = [data["v"] for variable_id, data in variables_data.items()]
-        if any(v < self.min_variance for v in new_vs):
-            logger.info(f"early stopping min variance {min(new_vs)}")
-            return True
-        if any(np.isnan(v) for v in new_vs):
+        new_vs = algo.get_variables_v(self.ids)
+        # single check in the usual case, v >= min_variance is false for nan
+        if not (new_vs >= self.min_variance).all():
+            if (new_vs < self.min_variance).any():
+                logger.info(f"early stopping min variance {np.nanmin(new_vs)}")
+                return True
             logger.warning("early stopping nan values")
             logger.info("restoring old message dag")
-            algo.reset_message_dag(self.old_message_dag)
+            algo.restore_message_dag(algo.old_messages)
             return True
-        if self.old_vs:
-            tols = [
-                np.abs(old_v - new_v)
-                for old_v, new_v in zip(self.old_vs, new_vs)
-            ]
-            if max(tols) < self.tol:
+        if self.old_vs is not None:
+            tols = np.abs(self.old_vs - new_vs)
+            if tols.max() < self.tol:
                 logger.info(
                     "early stopping all tolerances (on v) are "
                     f"below tol={self.tol:.2e}"
                 )
                 return True
-            increase = [
-                new_v - old_v for old_v, new_v in zip(self.old_vs, new_vs)
-            ]
-            if i > self.wait_increase and max(increase) > self.max_increase:
+            increase = new_vs - self.old_vs
+            if i > self.wait_increase and increase.max() > self.max_increase:
                 logger.info(
-                    f"increase={max(increase)} above "
+                    f"increase={increase.max()} above "
                     f"max_increase={self.max_increase:.2e}"
                 )
                 logger.info("restoring old message dag")
-                algo.reset_message_dag(self.old_message_dag)
+                algo.restore_message_dag(algo.old_messages)
                 return True
         # for next iteration
         self.old_vs = new_vs
-        self.old_message_dag = algo.message_dag.copy()
 
 
 def norm(x):
@@ -279,8 +273,7 @@ class EarlyStoppingEP(Callback):
                     f"max_increase={self.max_increase:.2e}"
                 )
                 logger.info("restoring old message dag")
-                algo.reset_message_dag(self.old_message_dag)
+                algo.restore_message_dag(algo.old_messages)
                 return True
         # for next iteration
         self.old_rs = new_rs
-        self.old_message_dag = algo.message_dag.copy()
@@ -3,6 +3,25 @@ import numpy as np
 
 
 class InitialConditions(ReprMixin):
+    # init only depends on message_key and shape, the messages returned by
+    # init_batch can then be shared by all the edges with the same shape
+    shared = False
+
+    def init_batch(self, message_keys, shapes):
+        """Initial messages for each (message_key, shape) pair.
+
+        Only valid if `self.shared`, the returned arrays are read-only as
+        they are shared across edges.
+        """
+        batch = {}
+        for message_key in message_keys:
+            for shape in shapes:
+                message = self.init(message_key, shape, None, None)
+                if isinstance(message, np.ndarray):
+                    message.flags.writeable = False
+                batch[(message_key, shape)] = message
+        return batch
+
     def init(self, message_key, shape, id, direction):
         if message_key == "a":
             return self.init_a(shape, id, direction)
@@ -11,6 +30,8 @@ class InitialConditions(ReprMixin):
 
 
 class ConstantInit(InitialConditions):
+    shared = True
+
     def __init__(self, a=0, b=0):
         self.a = a
         self.b = b
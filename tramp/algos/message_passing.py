@@ -4,6 +4,7 @@ from ..models import Model
 from ..base import Variable, Factor
 import numpy as np
 import networkx as nx
+from concurrent.futures import ThreadPoolExecutor
 import logging
 logger = logging.getLogger(__name__)
 
@@ -38,15 +39,6 @@ def info_message(message, keys=["a", "n_iter"]):
     return "\n".join(infos)
 
 
-def find_variable_in_nodes(id, nodes):
-    matchs = [
-        node for node in nodes
-        if isinstance(node, Variable) and node.id == id
-    ]
-    assert len(matchs) == 1
-    return matchs[0]
-
-
 def create_message(message, source, target, data):
     new_message = [
         (s, t, data if ((s == source) and (t == target)) else d)
@@ -63,9 +55,16 @@ class MessagePassing():
         self.message_keys = message_keys
         self.model_dag = model.dag
         self.forward_ordering = model.forward_ordering
-        self.backward_ordering = list(reversed(model.forward_ordering))
+        self.backward_ordering = model.backward_ordering
+        self.forward_levels = model.forward_levels
+        self.backward_levels = model.backward_levels
         self.variables = model.variables
+        # dense index of the variables, v_array[idx] = v of variable idx
+        self.variable_index = {
+            variable.id: idx for idx, variable in enumerate(self.variables)
+        }
         self.n_iter = 0
+        self.executor = None
 
     def configure_damping(self, damping):
         """Configure damping options
@@ -98,13 +97,18 @@ class MessagePassing():
                 (x_id, "bwd", damping) for x_id in x_ids
             ]
         for id, direction, damp in damping:
-            variable = find_variable_in_nodes(id, self.message_dag.nodes())
-            edges = self.message_dag.in_edges(variable, data=True)
+            variable = self.find_variable(id)
+            edges = self.in_messages[variable]
             for source, target, data in edges:
                 if data["direction"] == direction:
                     data["damping"] = damp
                     logger.info(info_arrow(source, target, data, ["damping"]))
 
+    def find_variable(self, id):
+        if id not in self.variable_index:
+            raise ValueError(f"id={id} not in variables")
+        return self.variables[self.variable_index[id]]
+
     def damp_message(self, message):
         "Damp message in-place"
         if not self.damping:
@@ -131,7 +135,7 @@ class MessagePassing():
             return 0
         variable = target if isinstance(target, Variable) else source
         data_old = self.message_dag[source][target]
-        m_target_old = self.message_dag.in_edges(target, data=True)
+        m_target_old = self.in_messages[target]
         m_edge_old = [
             (source, target, self.message_dag[source][target]),
             (target, source, self.message_dag[target][source])
@@ -156,7 +160,7 @@ class MessagePassing():
         data_var = {
             key: data[key] - data_old[key] for key in self.message_keys
         }
-        m_target_old = self.message_dag.in_edges(target, data=True)
+        m_target_old = self.in_messages[target]
         m_edge_old = [
             (source, target, self.message_dag[source][target]),
             (target, source, self.message_dag[target][source])
@@ -194,7 +198,7 @@ class MessagePassing():
                     info_message(old_message, keys=["n_iter", "a", "b"])
                 )
                 logger.warning("restoring old message dag")
-                self.reset_message_dag(self.old_message_dag)
+                self.restore_message_dag(self.old_messages)
                 raise ValueError(f"{source.id}->{target.id} a is nan")
             if (data['a'] < 0):
                 logger.warning(f"{source.id}->{target.id} negative a {data['a']}")
@@ -205,7 +209,7 @@ class MessagePassing():
                     info_message(old_message, keys=["n_iter", "a", "b"])
                 )
                 logger.warning("restoring old message dag")
-                self.reset_message_dag(self.old_message_dag)
+                self.restore_message_dag(self.old_messages)
                 raise ValueError(f"{source}->{target} b is nan")
 
     def init_message_dag(self, initializer):
@@ -219,24 +223,65 @@ class MessagePassing():
             self.model_dag.reverse().edges(data=True), direction="bwd",
             damping=None, n_iter=0
         )
-        for source, target, data in message_dag.edges(data=True):
+        edges = message_dag.edges(data=True)
+        for source, target, data in edges:
             variable = source if isinstance(source, Variable) else target
             x_data = self.model_dag.node[variable]
             data["tau"] = x_data.get("tau")
             data["shape"] = x_data.get("shape")
-            for message_key in self.message_keys:
-                data[message_key] = initializer.init(
-                    message_key, data["shape"], variable.id, data["direction"]
-                )
+        if initializer.shared:
+            # one init per distinct shape, shared across edges
+            shapes = set(data["shape"] for _, _, data in edges)
+            batch = initializer.init_batch(self.message_keys, shapes)
+            for source, target, data in edges:
+                for message_key in self.message_keys:
+                    data[message_key] = batch[(message_key, data["shape"])]
+        else:
+            for source, target, data in edges:
+                variable = source if isinstance(source, Variable) else target
+                for message_key in self.message_keys:
+                    data[message_key] = initializer.init(
+                        message_key, data["shape"], variable.id,
+                        data["direction"]
+                    )
         self.message_dag = message_dag
         nx.freeze(self.message_dag)
+        # incoming messages of each node, as the dag is frozen and the data
+        # dicts are updated in-place these lists stay valid
+        self.in_messages = {
+            node: message_dag.in_edges(node, data=True)
+            for node in message_dag.nodes()
+        }
+        self.v_array = np.full(len(self.variables), np.nan)
 
-    def reset_message_dag(self, message_dag):
-        self.message_dag = message_dag
-        self.variables = [
-            node for node in message_dag.nodes()
-            if isinstance(node, Variable)
-        ]
+    def snapshot_message_dag(self):
+        """Snapshot of the messages and variables data.
+
+        Messages are never updated in-place (update_message replaces the
+        arrays), so copying the data dicts is enough to restore them later.
+        The returned snapshot is a (nodes, edges, v_array) tuple.
+        """
+        nodes = {
+            node: data.copy() for node, data in self.message_dag.nodes(data=True)
+        }
+        edges = {
+            (source, target): data.copy()
+            for source, target, data in self.message_dag.edges(data=True)
+        }
+        return nodes, edges, self.v_array.copy()
+
+    def restore_message_dag(self, snapshot):
+        "Restore the messages and variables data from a snapshot"
+        nodes, edges, v_array = snapshot
+        for node, data in nodes.items():
+            node_data = self.message_dag.node[node]
+            node_data.clear()
+            node_data.update(data)
+        for (source, target), data in edges.items():
+            edge_data = self.message_dag[source][target]
+            edge_data.clear()
+            edge_data.update(data)
+        self.v_array[:] = v_array
 
     def update_message(self, new_message):
         for source, target, new_data in new_message:
@@ -246,35 +291,92 @@ class MessagePassing():
                 new_data["dA"] = self.compute_dA(source, target, new_data)
             self.message_dag[source][target].update(new_data)
 
+    def compute_new_messages(self, nodes, compute):
+        """Compute the new messages sent by the nodes of a level.
+
+        The nodes of a level are not adjacent: a node only reads its incoming
+        messages, which are not sent by the other nodes of the level. The new
+        messages can thus be computed concurrently (numpy releases the GIL).
+        """
+        messages = [self.in_messages[node] for node in nodes]
+        if self.executor and len(nodes) > 1:
+            new_messages = list(self.executor.map(compute, nodes, messages))
+        else:
+            new_messages = [
+                compute(node, message) for node, message in zip(nodes, messages)
+            ]
+        return zip(messages, new_messages)
+
     def forward_message(self):
-        for node in self.forward_ordering:
-            message = self.message_dag.in_edges(node, data=True)
-            new_message = self.forward(node, message)
-            self.check_message(new_message, message)
-            self.damp_message(new_message)
-            self.update_message(new_message)
+        for nodes in self.forward_levels:
+            new_messages = self.compute_new_messages(nodes, self.forward)
+            for message, new_message in new_messages:
+                self.check_message(new_message, message)
+                self.damp_message(new_message)
+                self.update_message(new_message)
 
     def backward_message(self):
-        for node in self.backward_ordering:
-            message = self.message_dag.in_edges(node, data=True)
-            new_message = self.backward(node, message)
-            self.check_message(new_message, message)
-            self.damp_message(new_message)
-            self.update_message(new_message)
+        for nodes in self.backward_levels:
+            new_messages = self.compute_new_messages(nodes, self.backward)
+            for message, new_message in new_messages:
+                self.check_message(new_message, message)
+                self.damp_message(new_message)
+                self.update_message(new_message)
 
     def update_variables(self):
         for variable in self.variables:
-            message = self.message_dag.in_edges(variable, data=True)
+            message = self.in_messages[variable]
             new_data = self.update(variable, message)
             self.message_dag.node[variable].update(new_data)
+            self.v_array[self.variable_index[variable.id]] = new_data["v"]
+
+    def get_variables_index(self, ids="all"):
+        "Dense index of the variables with id in ids, in the variables order"
+        if ids == "all":
+            return list(range(len(self.variables)))
+        return sorted(
+            self.variable_index[id] for id in ids if id in self.variable_index
+        )
 
     def get_variables_data(self, ids="all"):
         data = {}
-        for variable in self.variables:
-            if ids == "all" or variable.id in ids:
-                data[variable.id] = self.message_dag.node[variable].copy()
+        for idx in self.get_variables_index(ids):
+            variable = self.variables[idx]
+            data[variable.id] = self.message_dag.node[variable].copy()
         return data
 
+    def get_variables_v(self, ids="all"):
+        "Return the variances v of the variables as an array"
+        return self.v_array[self.get_variables_index(ids)]
+
+    def get_variables_columns(self, ids="all", keys=[]):
+        """Return the variables data as columns
+
+        Parameters
+        ----------
+        - ids: "all" or list of variable ids
+        - keys: list of keys of the variables data
+
+        Returns
+        -------
+        - columns: dict
+            columns["id"] the list of ids, columns["v"] the array of their
+            variances and columns[key] the list of values for each key.
+        """
+        idx = self.get_variables_index(ids)
+        variables = [self.variables[i] for i in idx]
+        columns = dict(
+            id=[variable.id for variable in variables], v=self.v_array[idx]
+        )
+        for key in keys:
+            if key in columns:
+                continue
+            columns[key] = [
+                self.message_dag.node[variable].get(key)
+                for variable in variables
+            ]
+        return columns
+
     def get_edges_data(self, keys):
         records = []
         for source, target, data in self.message_dag.edges(data=True):
@@ -298,14 +400,12 @@ class MessagePassing():
         return records
 
     def get_variable_data(self, id):
-        for variable in self.variables:
-            if variable.id == id:
-                return self.message_dag.node[variable].copy()
-        raise ValueError(f"id={id} not in variables")
+        variable = self.find_variable(id)
+        return self.message_dag.node[variable].copy()
 
     def update_objective(self):
         for node in self.forward_ordering:
-            message = self.message_dag.in_edges(node, data=True)
+            message = self.in_messages[node]
             A = self.node_objective(node, message)
             self.message_dag.node[node].update(A=A)
         for source, target, data in self.message_dag.edges(data=True):
@@ -329,7 +429,27 @@ class MessagePassing():
 
     def iterate(self, max_iter=200,
                 callback=None, initializer=None, damping=None,
-                warm_start=False, update_dA=False):
+                warm_start=False, update_dA=False, n_workers=1):
+        """Iterate the message passing
+
+        Parameters
+        ----------
+        - max_iter: int
+            Maximal number of iterations
+        - callback: callable or None
+            Called as callback(algo, i, max_iter) after each iteration,
+            stops the iterations when it returns True.
+        - initializer: InitialConditions or None
+            Initial messages, default ConstantInit(a=0, b=0)
+        - damping: see configure_damping
+        - warm_start: bool
+            If True start from the current messages
+        - update_dA: bool
+            If True compute the objective variation dA of each new message
+        - n_workers: int
+            Number of threads computing the new messages of nodes of a same
+            level. Default n_workers=1 is sequential.
+        """
         initializer = initializer or ConstantInit(a=0, b=0)
         callback = callback or self.default_stopping
         if warm_start:
@@ -342,16 +462,28 @@ class MessagePassing():
             self.n_iter = 0
         self.configure_damping(damping)
         self.update_dA = update_dA
-        for i in range(max_iter):
-            # forward, backward, update pass
-            self.forward_message()
-            self.backward_message()
-            self.update_variables()
-            # callbacks
-            self.n_iter += 1
-            stop = callback(self, i, max_iter)
-            if stop:
-                logger.info(f"terminated after n_iter={self.n_iter} iterations")
-                return
-            self.old_message_dag = self.message_dag.copy()
-        logger.info(f"terminated after n_iter={self.n_iter} iterations")
+        # messages before the current iteration, restored by check_message
+        # and the early stopping callbacks
+        self.old_messages = self.snapshot_message_dag()
+        if n_workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=n_workers)
+        try:
+            for i in range(max_iter):
+                # forward, backward, update pass
+                self.forward_message()
+                self.backward_message()
+                self.update_variables()
+                # callbacks
+                self.n_iter += 1
+                stop = callback(self, i, max_iter)
+                if stop:
+                    logger.info(
+                        f"terminated after n_iter={self.n_iter} iterations"
+                    )
+                    return
+                self.old_messages = self.snapshot_message_dag()
+            logger.info(f"terminated after n_iter={self.n_iter} iterations")
+        finally:
+            if self.executor:
+                self.executor.shutdown()
+                self.executor = None
@@ -1,36 +1,149 @@
 import numpy as np
-from numpy.fft import fftn, ifftn
 from ..base_channel import Channel
 from tramp.utils.conv_filters import gradient_filters
 import logging
 logger = logging.getLogger(__name__)
+try:
+    # pyfftw plans are cached so repeated ffts on the same shape are not replanned
+    import pyfftw
+    pyfftw.interfaces.cache.enable()
+    from pyfftw.interfaces.scipy_fft import fftn, ifftn, rfftn, irfftn
+except ImportError:
+    from scipy.fft import fftn, ifftn, rfftn, irfftn
 
 
 
 class GradientChannel(Channel):
-    "Gradient channel x = grad z "
-
-    def __init__(self, shape, real=True):
+    """Gradient channel x = grad z
+
+    Parameters
+    ----------
+    - shape: tuple
+        Shape of z. The gradient x is of shape (d,) + shape with d = len(shape).
+    - real: bool
+        if True assume x, z real and use the real fft (half spectrum)
+        if False assume x, z complex and use the full fft
+    - workers: int
+        Number of workers for the ffts, -1 uses all the cpus
+    - dtype: np.float32 or np.float64
+        Precision of the ffts. Single precision halves the memory traffic
+        of the ffts (complex64 spectra) at the cost of accuracy.
+    - backend: {"numpy", "cupy"}
+        If "cupy" the ffts are done on the gpu with cupy. The filter spectra
+        are kept on the device and the arrays are only transferred at the
+        boundaries of the channel (inputs and returned means).
+
+    Notes
+    -----
+    When real=True the ffts are taken with rfftn / irfftn, so `w_fft` and
+    `w_fft_bar` only hold the half spectrum along the last axis, as does the
+    power spectrum `half_spectrum` used by the resolvent. The full grid
+    `spectrum` is still kept as it is needed for the mean over frequencies
+    in `n_eff`.
+    """
+
+    def __init__(self, shape, real=True, workers=-1, dtype=np.float64,
+                 backend="numpy"):
+        if backend not in ["numpy", "cupy"]:
+            raise ValueError(f"backend={backend} must be 'numpy' or 'cupy'")
         self.d = len(shape)
         self.shape = shape
         self.real = real
+        self.workers = workers
+        self.dtype = dtype
+        self.backend = backend
         self.repr_init()
-        self.filter = gradient_filters(shape)
+        self.dtype = np.dtype(dtype)
+        # dtype of the arrays entering the ffts
+        self._input_dtype = (
+            self.dtype if real else np.result_type(self.dtype, np.complex64)
+        )
+        self._init_backend()
+        self.filter = gradient_filters(shape).astype(self.dtype)
         self.axes = list(range(1, self.d + 1)) # axes over which fft is taken
         # conv weights = time reversed filter; their ffts are conjugate
-        self.w_fft_bar = fftn(self.filter, axes=self.axes)
-        self.w_fft = np.conjugate(self.w_fft_bar)
-        self.spectrum = (np.absolute(self.w_fft)**2).sum(axis=0)
+        self.w_fft_bar = self._fftn(self.filter, axes=self.axes)
+        self.w_fft = self.xp.conjugate(self.w_fft_bar)
+        # power spectrum over the half (rfft) frequencies used by the
+        # convolutions, equal to the full spectrum when real=False
+        self.half_spectrum = (self.xp.absolute(self.w_fft)**2).sum(axis=0)
+        # power spectrum over the full grid
+        f_fft = fftn(self.filter, axes=self.axes)
+        self.spectrum = (np.absolute(f_fft)**2).sum(axis=0)
         assert self.spectrum.shape == shape
+        self.spectrum_mean = self.spectrum.mean()
+        # last bz (copy) and its fft, reused while bz is unchanged
+        self._last_bz = None
+        self._last_bz_fft = None
+        # az, ax change slowly over iterations: cache n_eff and resolvent
+        # plain dicts keyed by (az, ax) so that the channel can be copied
+        self._n_eff_buffer = np.empty_like(self.spectrum)
+        self._n_eff_cache = {}
+        self._resolvent_cache = {}
+
+    def _init_backend(self):
+        if self.backend == "cupy":
+            # cupyx.scipy.fft as cupy.fft does not accept overwrite_x
+            from cupyx.scipy import fft as cufft
+            self._fft_funcs = dict(
+                fftn=cufft.fftn, ifftn=cufft.ifftn,
+                rfftn=cufft.rfftn, irfftn=cufft.irfftn
+            )
+            self._fft_kwargs = {}
+        else:
+            self._fft_funcs = dict(
+                fftn=fftn, ifftn=ifftn, rfftn=rfftn, irfftn=irfftn
+            )
+            self._fft_kwargs = dict(workers=self.workers)
+
+    @property
+    def xp(self):
+        "Array module of the backend"
+        if self.backend == "cupy":
+            import cupy
+            return cupy
+        return np
+
+    def _to_host(self, x):
+        if self.backend == "cupy":
+            return self.xp.asnumpy(x)
+        return x
+
+    def _fftn(self, z, axes=None):
+        "Fft of z, returned on the device"
+        z = self.xp.asarray(z, dtype=self._input_dtype)
+        name = "rfftn" if self.real else "fftn"
+        return self._fft_funcs[name](z, axes=axes, **self._fft_kwargs)
+
+    def _ifftn(self, z_fft, axes=None):
+        "Inverse fft back on the host, the temporary z_fft is overwritten"
+        kwargs = dict(axes=axes, overwrite_x=True, **self._fft_kwargs)
+        if self.real:
+            z = self._fft_funcs["irfftn"](z_fft, s=self.shape, **kwargs)
+        else:
+            z = self._fft_funcs["ifftn"](z_fft, **kwargs)
+        return self._to_host(z)
+
+    def _bz_fft(self, bz):
+        "fft of bz, cached as fwd and bwd messages of an iteration share bz"
+        # compare values, not identity, as bz may be mutated in-place
+        # between calls; the comparison is much cheaper than the fft
+        bz = np.asarray(bz)
+        unchanged = (
+            self._last_bz is not None and self._last_bz.dtype == bz.dtype
+            and np.array_equal(self._last_bz, bz)
+        )
+        if not unchanged:
+            self._last_bz = bz.copy()
+            self._last_bz_fft = self._fftn(bz)
+        return self._last_bz_fft
 
     def convolve(self, z):
         if (z.shape != self.shape):
             raise ValueError(f"Bad shape for z: {z.shape} expected {self.shape}")
-        z_fft = fftn(z)
+        z_fft = self._fftn(z)
         x_fft = self.w_fft * z_fft[np.newaxis,:]
-        x = ifftn(x_fft, axes=self.axes) # no fft over axis=0 (grad direction)
-        if self.real:
-            x = np.real(x)
+        x = self._ifftn(x_fft, axes=self.axes) # no fft over axis=0 (grad direction)
         return x
 
     def sample(self, Z):
@@ -40,7 +153,7 @@ class GradientChannel(Channel):
         return r"$\nabla$"
 
     def second_moment(self, tau_z):
-        return tau_z * self.spectrum.mean() / self.d
+        return tau_z * self.spectrum_mean / self.d
 
     def compute_n_eff(self, az, ax):
         "Effective number of parameters = overlap in z"
@@ -50,29 +163,53 @@ class GradientChannel(Channel):
         if az / ax == 0:
             logger.info(f"az/ax=0 in {self} compute_n_eff")
             return 1.
-        n_eff = np.mean(self.spectrum / (az / ax + self.spectrum))
+        n_eff = self._cached(
+            self._n_eff_cache, self._compute_n_eff, az, ax, maxsize=8
+        )
         return n_eff
 
+    def _cached(self, cache, compute, az, ax, maxsize):
+        "compute(az, ax) stored in cache, the oldest entry is evicted"
+        key = (float(az), float(ax))
+        if key not in cache:
+            if len(cache) >= maxsize:
+                cache.pop(next(iter(cache)))
+            cache[key] = compute(*key)
+        return cache[key]
+
+    def _compute_n_eff(self, az, ax):
+        buffer = np.add(self.spectrum, az / ax, out=self._n_eff_buffer)
+        np.divide(self.spectrum, buffer, out=buffer)
+        return buffer.mean()
+
+    def _compute_resolvent(self, az, ax):
+        resolvent = 1 / (az + ax * self.half_spectrum)
+        if self.backend == "numpy":
+            resolvent.flags.writeable = False  # shared by the cache
+        return resolvent
+
     def compute_backward_mean(self, az, bz, ax, bx, return_fft=False):
-        # estimate z from x = Wz
-        bx_fft = fftn(bx, axes=self.axes) # no fft over axis=0 (grad direction)
-        bz_fft = fftn(bz)
-        resolvent = 1 / (az + ax * self.spectrum)
-        rz_fft = resolvent * (bz_fft + (self.w_fft_bar * bx_fft).sum(axis=0))
+        # estimate z from x = Wz, if return_fft rz_fft is kept on the device
+        bx_fft = self._fftn(bx, axes=self.axes) # no fft over axis=0 (grad direction)
+        bz_fft = self._bz_fft(bz)
+        resolvent = self._cached(
+            self._resolvent_cache, self._compute_resolvent, az, ax, maxsize=2
+        )
+        # sum over the d grad directions fused with the product, then
+        # updated in-place: rz_fft is the only array allocated
+        rz_fft = self.xp.einsum("d...,d...->...", self.w_fft_bar, bx_fft)
+        rz_fft += bz_fft
+        rz_fft *= resolvent
         if return_fft:
             return rz_fft
-        rz = ifftn(rz_fft)
-        if self.real:
-            rz = np.real(rz)
+        rz = self._ifftn(rz_fft)
         return rz
 
     def compute_forward_mean(self, az, bz, ax, bx):
         # estimate x from x = Wz we have rx = W rz
         rz_fft = self.compute_backward_mean(az, bz, ax, bx, return_fft=True)
         rx_fft = self.w_fft * rz_fft[np.newaxis,:]
-        rx = ifftn(rx_fft, axes=self.axes)
-        if self.real:
-            rx = np.real(rx)
+        rx = self._ifftn(rx_fft, axes=self.axes)
         return rx
 
     def compute_backward_variance(self, az, ax):
@@ -83,8 +220,7 @@ class GradientChannel(Channel):
 
     def compute_forward_variance(self, az, ax):
         if ax == 0:
-            s_mean = np.mean(self.spectrum)
-            return s_mean / az
+            return self.spectrum_mean / az
         n_eff = self.compute_n_eff(az, ax)
         vx = n_eff / (ax * self.d)
         return vx
@@ -1,5 +1,53 @@
 import numpy as np
 from ..base_channel import SOFactor
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+def stack_ab(az, bz):
+    "Stack the n_prev scalars a and arrays b (cast to float or complex)"
+    az = np.asarray(az, dtype=float)
+    bz = np.stack(bz)
+    bz = bz.astype(np.result_type(bz, float), copy=False)
+    return az, bz
+
+
+if HAS_NUMBA:
+    # fused single pass kernels, bz of shape (n_prev, N) and bx of shape (N,)
+    # error_model="numpy" : division by zero gives inf as in the numpy path
+    # the outputs take the dtype of bz (float or complex), r_bar = 0 * bz
+    # is initialized with the same type
+
+    @njit(cache=True, error_model="numpy")
+    def fused_forward_message(az, bz):
+        n_prev, N = bz.shape
+        vz = 1 / az
+        v_bar = vz.sum()
+        bx_new = np.empty_like(bz[0])
+        for i in range(N):
+            r_bar = 0 * bz[0, i]
+            for k in range(n_prev):
+                r_bar += vz[k] * bz[k, i]
+            bx_new[i] = r_bar / v_bar
+        return 1 / v_bar, bx_new
+
+    @njit(cache=True, error_model="numpy")
+    def fused_backward_message(az, bz, ax, bx):
+        n_prev, N = bz.shape
+        vz = 1 / az
+        az_new = 1 / (1 / ax + vz.sum() - vz)
+        bz_new = np.empty_like(bz)
+        for i in range(N):
+            r_bar = 0 * bz[0, i]
+            for k in range(n_prev):
+                r_bar += vz[k] * bz[k, i]
+            rx = bx[i] / ax
+            for k in range(n_prev):
+                bz_new[k, i] = az_new[k] * (rx - r_bar + vz[k] * bz[k, i])
+        return az_new, bz_new
 
 
 class SumChannel(SOFactor):
@@ -25,34 +73,54 @@ class SumChannel(SOFactor):
 
     def compute_forward_message(self, az, bz, ax, bx):
         "fwd message to x; for x = sum(z)"
-        v_bar = sum(1 / a for a in az)
-        r_bar = sum(b / a for a, b in zip(az, bz))
+        az, bz = stack_ab(az, bz)
+        if HAS_NUMBA:
+            ax_new, bx_new = fused_forward_message(az, bz.reshape(len(az), -1))
+            return ax_new, bx_new.reshape(bz.shape[1:])
+        vz = 1 / az
+        v_bar = vz.sum()
+        r_bar = np.einsum("k,k...->...", vz, bz)
         ax_new = 1 / v_bar
         bx_new = r_bar / v_bar
         return ax_new, bx_new
 
     def compute_backward_message(self, az, bz, ax, bx):
-        "bwd message to z = {zk}; for x = sum(z)"
-        v_bar = sum(1 / a for a in az)
-        r_bar = sum(b / a for a, b in zip(az, bz))
+        """bwd message to z = {zk}; for x = sum(z)
+
+        The messages are returned stacked along axis 0.
+        """
+        az, bz = stack_ab(az, bz)
+        if HAS_NUMBA:
+            # bz and bx share the same dtype, bz_new takes it
+            dtype = np.result_type(bz, bx)
+            az_new, bz_new = fused_backward_message(
+                az, bz.reshape(len(az), -1).astype(dtype, copy=False),
+                float(ax), np.ravel(bx).astype(dtype, copy=False)
+            )
+            return az_new, bz_new.reshape(bz.shape)
+        vz = 1 / az
+        rz = np.einsum("k,k...->k...", vz, bz)
+        v_bar = vz.sum()
+        r_bar = rz.sum(axis=0)
         vx = 1 / ax
         rx = bx / ax
-        vk = [vx + v_bar - 1 / a for a in az]
-        rk = [rx - r_bar + b / a for a, b in zip(az, bz)]
-        az_new = [1 / v for v in vk]
-        bz_new = [r / v for v, r in zip(vk, rk)]
+        vk = vx + v_bar - vz
+        rk = rx - r_bar + rz
+        az_new = 1 / vk
+        bz_new = np.einsum("k,k...->k...", az_new, rk)
         return az_new, bz_new
 
     def compute_forward_state_evolution(self, az, ax, tau_z):
         "fwd state evo to x; for x = sum(z)"
-        v_bar = sum(1 / a for a in az)
+        v_bar = np.sum(1 / np.asarray(az, dtype=float))
         ax_new = 1 / v_bar
         return ax_new
 
     def compute_backward_state_evolution(self, az, ax, tau_z):
         "bwd state evo to z = {zk}; for x = sum(z)"
-        v_bar = sum(1 / a for a in az)
+        vz = 1 / np.asarray(az, dtype=float)
+        v_bar = vz.sum()
         vx = 1 / ax
-        vk = [vx + v_bar - 1 / a for a in az]
-        az_new = [1 / v for v in vk]
+        vk = vx + v_bar - vz
+        az_new = 1 / vk
         return az_new
@@ -1,6 +1,12 @@
+import numpy as np
 from ..base_channel import Channel
 
 
+def to_shape(shape):
+    "Shape as a tuple of ints"
+    return tuple(int(n) for n in np.atleast_1d(shape))
+
+
 class ReshapeChannel(Channel):
     """
     Reshape array
@@ -9,12 +15,18 @@ class ReshapeChannel(Channel):
     ----------
     - next_shape : output shape
     - prev_shape : input shape
+
+    Notes
+    -----
+    The reshapes of C-contiguous arrays are views, no data is copied.
     """
 
     def __init__(self, prev_shape, next_shape):
         self.prev_shape = prev_shape
         self.next_shape = next_shape
         self.repr_init()
+        self.prev_shape = to_shape(prev_shape)
+        self.next_shape = to_shape(next_shape)
 
     def sample(self, Z):
         return Z.reshape(self.next_shape)
@@ -39,7 +51,7 @@ class ReshapeChannel(Channel):
 
     def compute_log_partition(self, az, bz, ax, bx):
         a = az + ax
-        b = bz + bx.rehape(self.prev_shape)
+        b = bz + bx.reshape(self.prev_shape)
         logZ = 0.5 * np.sum(b**2 / a + np.log(2 * np.pi / a))
         return logZ
 
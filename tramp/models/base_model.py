@@ -20,6 +20,29 @@ def check_variable_ids(variables):
         raise ValueError(f"having {n_unique} ids but {n_variables} variables")
 
 
+def get_levels(ordering, parents):
+    """Group the nodes by level, the length of the longest path to a root.
+
+    Parameters
+    ----------
+    - ordering : list of nodes in topological order
+    - parents : function returning the parents of a node
+
+    Returns
+    -------
+    - levels : list of lists of nodes
+        Nodes in a level are not adjacent and keep the ordering.
+    """
+    level = {}
+    for node in ordering:
+        level[node] = 1 + max((level[p] for p in parents(node)), default=-1)
+    n_levels = 1 + max(level.values(), default=-1)
+    levels = [[] for _ in range(n_levels)]
+    for node in ordering:
+        levels[level[node]].append(node)
+    return levels
+
+
 def add_factor_ids(factors):
     for idx, factor in enumerate(factors):
         factor.id = f"f_{idx}"
@@ -33,6 +56,14 @@ class Model(ReprMixin):
         self.model_dag = model_dag
         self.dag = model_dag.dag.copy()
         self.forward_ordering = nx.topological_sort(self.dag)
+        self.backward_ordering = list(reversed(self.forward_ordering))
+        # nodes of a level are not adjacent
+        self.forward_levels = get_levels(
+            self.forward_ordering, self.dag.predecessors
+        )
+        self.backward_levels = get_levels(
+            self.backward_ordering, self.dag.successors
+        )
         self.variables = [
             node for node in self.forward_ordering
             if isinstance(node, Variable)
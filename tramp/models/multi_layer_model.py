@@ -3,6 +3,8 @@ from ..channels.base_channel import Channel
 from ..likelihoods.base_likelihood import Likelihood
 from ..variables import SISOVariable, SILeafVariable
 from .base_model import Model
+from .dag_algebra import ModelDAG
+import networkx as nx
 
 
 def check_layers(layers):
@@ -42,8 +44,15 @@ class MultiLayerModel(Model):
         def get_variable(l):
             V = SILeafVariable if l == n_layers-1 else SISOVariable
             return V(id=ids[l])
-        dag = layers[0] @ get_variable(0)
-        for l in range(1, n_layers):
-            dag = dag @ layers[l] @ get_variable(l)
-        model_dag = dag.to_model_dag()
+        # chain layer_0 -> x_0 -> layer_1 -> ... built at once, composing
+        # with @ would copy the whole dag at each layer
+        dag = nx.DiGraph()
+        prev_variable = None
+        for l, layer in enumerate(layers):
+            variable = get_variable(l)
+            if prev_variable is not None:
+                dag.add_edge(prev_variable, layer)
+            dag.add_edge(layer, variable)
+            prev_variable = variable
+        model_dag = ModelDAG(dag)
         Model.__init__(self, model_dag)
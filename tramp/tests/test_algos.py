@@ -0,0 +1,98 @@
+import unittest
+from tramp.variables import (
+    SIMOVariable, MILeafVariable, SILeafVariable as O
+)
+from tramp.channels import GaussianChannel, GradientChannel
+from tramp.priors import GaussBernouilliPrior, GaussianPrior
+from tramp.algos import ExpectationPropagation, EarlyStopping, JoinCallback
+from tramp.algos.initial_conditions import ConstantInit
+import numpy as np
+
+
+def tv_model(shape, seed=0):
+    "Sparse gradient regression model observed on random y"
+    student = (
+        GaussianPrior(size=shape) @ SIMOVariable(id="x", n_next=2) @ (
+            GaussianChannel(var=0.1) @ O("y") + (
+                GradientChannel(shape=shape) +
+                GaussBernouilliPrior(size=(2,) + shape, rho=0.3)
+            ) @ MILeafVariable(id="x'", n_prev=2)
+        )
+    ).to_model()
+    y = np.random.RandomState(seed).standard_normal(shape)
+    return student.to_observed({"y": y})
+
+
+def set_nan_v(algo, i, max_iter):
+    "Callback corrupting the variances"
+    algo.v_array[:] = np.nan
+
+
+class AlgosTest(unittest.TestCase):
+    def setUp(self):
+        self.model = tv_model(shape=(8, 6))
+
+    def tearDown(self):
+        pass
+
+    def test_n_workers(self):
+        ep = ExpectationPropagation(self.model)
+        ep.iterate(max_iter=20)
+        ep_workers = ExpectationPropagation(self.model)
+        ep_workers.iterate(max_iter=20, n_workers=4)
+        self.assertIsNone(ep_workers.executor)
+        data = ep.get_variables_data()
+        data_workers = ep_workers.get_variables_data()
+        for variable_id in data:
+            np.testing.assert_array_equal(
+                data_workers[variable_id]["r"], data[variable_id]["r"]
+            )
+            self.assertEqual(
+                data_workers[variable_id]["v"], data[variable_id]["v"]
+            )
+
+    def test_snapshot_restore(self):
+        ep = ExpectationPropagation(self.model)
+        ep.iterate(max_iter=3)
+        snapshot = ep.snapshot_message_dag()
+        v = ep.get_variables_v()
+        messages = {
+            (source, target): data["b"]
+            for source, target, data in ep.message_dag.edges(data=True)
+        }
+        ep.iterate(max_iter=3, warm_start=True)
+        ep.restore_message_dag(snapshot)
+        np.testing.assert_array_equal(ep.get_variables_v(), v)
+        for source, target, data in ep.message_dag.edges(data=True):
+            self.assertIs(data["b"], messages[(source, target)])
+
+    def test_variables_columns(self):
+        ep = ExpectationPropagation(self.model)
+        ep.iterate(max_iter=3)
+        data = ep.get_variables_data()
+        columns = ep.get_variables_columns(keys=["r"])
+        self.assertEqual(sorted(columns["id"]), sorted(data))
+        for variable_id, v, r in zip(columns["id"], columns["v"], columns["r"]):
+            self.assertEqual(v, data[variable_id]["v"])
+            np.testing.assert_array_equal(r, data[variable_id]["r"])
+
+    def test_shared_init(self):
+        ep = ExpectationPropagation(self.model)
+        ep.init_message_dag(ConstantInit(a=1, b=2))
+        for source, target, data in ep.message_dag.edges(data=True):
+            self.assertEqual(data["a"], 1)
+            np.testing.assert_array_equal(data["b"], 2 * np.ones(data["shape"]))
+            self.assertFalse(data["b"].flags.writeable)
+
+    def test_early_stopping_nan_first_iteration(self):
+        ep = ExpectationPropagation(self.model)
+        callback = JoinCallback([set_nan_v, EarlyStopping()])
+        ep.iterate(max_iter=5, callback=callback)
+        self.assertEqual(ep.n_iter, 1)
+        # messages restored to their initial values
+        for source, target, data in ep.message_dag.edges(data=True):
+            self.assertEqual(data["a"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
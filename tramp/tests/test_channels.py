@@ -1,7 +1,14 @@
 import unittest
+from unittest import mock
+import copy
+import importlib.util
+import pickle
 from tramp.channels import (
-    AbsChannel, SgnChannel, ReluChannel, LeakyReluChannel, HardTanhChannel
+    AbsChannel, SgnChannel, ReluChannel, LeakyReluChannel, HardTanhChannel,
+    GradientChannel, SumChannel
 )
+from tramp.channels.linear import sum_channel
+from tramp.utils.conv_filters import gradient_filters
 import numpy as np
 
 
@@ -50,6 +57,46 @@ def explicit_integral(az, bz, ax, bx, channel):
     return rz, vz, rx, vx
 
 
+def gradient_fft_reference(az, bz, ax, bx, z, real):
+    """
+    Compute x = grad z, rz, rx, vz, vx with the full numpy fft
+    """
+    d = len(z.shape)
+    axes = list(range(1, d + 1))
+    w_fft = np.conjugate(np.fft.fftn(gradient_filters(z.shape), axes=axes))
+    spectrum = (np.absolute(w_fft)**2).sum(axis=0)
+    x = np.fft.ifftn(w_fft * np.fft.fftn(z), axes=axes)
+    rz_fft = (
+        (np.conjugate(w_fft) * np.fft.fftn(bx, axes=axes)).sum(axis=0) +
+        np.fft.fftn(bz)
+    ) / (az + ax * spectrum)
+    rz = np.fft.ifftn(rz_fft)
+    rx = np.fft.ifftn(w_fft * rz_fft, axes=axes)
+    n_eff = np.mean(spectrum / (az / ax + spectrum))
+    vz = (1 - n_eff) / az
+    vx = n_eff / (ax * d)
+    if real:
+        x, rz, rx = np.real(x), np.real(rz), np.real(rx)
+    return x, rz, vz, rx, vx
+
+
+def sum_messages_reference(az, bz, ax, bx):
+    """
+    Compute the fwd and bwd messages of x = sum(z) over lists of az, bz
+    """
+    v_bar = sum(1 / a for a in az)
+    r_bar = sum(b / a for a, b in zip(az, bz))
+    ax_fwd = 1 / v_bar
+    bx_fwd = r_bar / v_bar
+    vx = 1 / ax
+    rx = bx / ax
+    vk = [vx + v_bar - 1 / a for a in az]
+    rk = [rx - r_bar + b / a for a, b in zip(az, bz)]
+    az_bwd = [1 / v for v in vk]
+    bz_bwd = [r / v for v, r in zip(vk, rk)]
+    return ax_fwd, bx_fwd, az_bwd, bz_bwd
+
+
 class ChannelsTest(unittest.TestCase):
     def setUp(self):
         self.records = [
@@ -146,5 +193,148 @@ class ChannelsTest(unittest.TestCase):
         self._test_function_proba(channel, self.records)
 
 
+class SumChannelTest(unittest.TestCase):
+    def setUp(self):
+        self.az = [1.0, 2.0, 0.5]
+        self.ax = 1.5
+        self.bx = np.arange(4.)
+        self.bzs = [
+            [np.arange(4.), 2 * np.arange(4.), np.arange(4.) + 1],
+            # integer b must not be truncated
+            [np.arange(4), 2 * np.arange(4), np.arange(4) + 1],
+            [np.arange(4) + 1j, 2 * np.arange(4.), np.arange(4.) + 1]
+        ]
+
+    def tearDown(self):
+        pass
+
+    def _compute_messages(self, channel, bz, bx):
+        ax_new, bx_new = channel.compute_forward_message(
+            self.az, bz, self.ax, bx
+        )
+        az_new, bz_new = channel.compute_backward_message(
+            self.az, bz, self.ax, bx
+        )
+        return ax_new, bx_new, az_new, bz_new
+
+    def test_sum_messages(self):
+        channel = SumChannel(n_prev=3)
+        for bz in self.bzs:
+            messages = self._compute_messages(channel, bz, self.bx)
+            expected = sum_messages_reference(self.az, bz, self.ax, self.bx)
+            for message, expected_message in zip(messages, expected):
+                np.testing.assert_allclose(
+                    message, expected_message, rtol=1e-12
+                )
+        ax_new = channel.compute_forward_state_evolution(self.az, self.ax, 1.)
+        az_new = channel.compute_backward_state_evolution(self.az, self.ax, 1.)
+        np.testing.assert_allclose(ax_new, expected[0], rtol=1e-12)
+        np.testing.assert_allclose(az_new, expected[2], rtol=1e-12)
+
+    @unittest.skipUnless(sum_channel.HAS_NUMBA, "numba not installed")
+    def test_numba_matches_numpy(self):
+        channel = SumChannel(n_prev=3)
+        for bz in self.bzs:
+            for bx in [self.bx, self.bx + 1j]:
+                with mock.patch.object(sum_channel, "HAS_NUMBA", True):
+                    numba_messages = self._compute_messages(channel, bz, bx)
+                with mock.patch.object(sum_channel, "HAS_NUMBA", False):
+                    numpy_messages = self._compute_messages(channel, bz, bx)
+                for m_numba, m_numpy in zip(numba_messages, numpy_messages):
+                    self.assertEqual(
+                        np.result_type(m_numba), np.result_type(m_numpy)
+                    )
+                    np.testing.assert_allclose(m_numba, m_numpy, rtol=1e-12)
+
+
+class GradientChannelTest(unittest.TestCase):
+    def setUp(self):
+        self.shape = (8, 6)
+        self.az, self.ax = 2.0, 1.5
+        rng = np.random.RandomState(42)
+        self.bz = rng.standard_normal(self.shape)
+        self.bx = rng.standard_normal((2,) + self.shape)
+
+    def tearDown(self):
+        pass
+
+    def _test_function_fft_reference(self, channel, bz, bx, z, rtol):
+        az, ax = self.az, self.ax
+        x, rz, vz, rx, vx = gradient_fft_reference(
+            az, bz, ax, bx, z, real=channel.real
+        )
+        np.testing.assert_allclose(channel.convolve(z), x, rtol=rtol, atol=rtol)
+        rz_hat, vz_hat = channel.compute_backward_posterior(az, bz, ax, bx)
+        rx_hat, vx_hat = channel.compute_forward_posterior(az, bz, ax, bx)
+        np.testing.assert_allclose(rz_hat, rz, rtol=rtol, atol=rtol)
+        np.testing.assert_allclose(rx_hat, rx, rtol=rtol, atol=rtol)
+        self.assertAlmostEqual(vz_hat / vz, 1, delta=rtol)
+        self.assertAlmostEqual(vx_hat / vx, 1, delta=rtol)
+
+    def test_real_fft_reference(self):
+        # odd last axis to check the half spectrum of rfftn
+        for shape in [self.shape, (8, 7), (5, 4, 3)]:
+            channel = GradientChannel(shape)
+            rng = np.random.RandomState(0)
+            bz = rng.standard_normal(shape)
+            bx = rng.standard_normal((len(shape),) + shape)
+            z = rng.standard_normal(shape)
+            self._test_function_fft_reference(channel, bz, bx, z, rtol=1e-10)
+
+    def test_complex_fft_reference(self):
+        channel = GradientChannel(self.shape, real=False)
+        rng = np.random.RandomState(0)
+        bz = self.bz + 1j * rng.standard_normal(self.shape)
+        bx = self.bx + 1j * rng.standard_normal(self.bx.shape)
+        z = rng.standard_normal(self.shape) + 1j * self.bz
+        self._test_function_fft_reference(channel, bz, bx, z, rtol=1e-10)
+
+    def test_float32(self):
+        channel = GradientChannel(self.shape, dtype=np.float32)
+        rz_hat = channel.compute_backward_mean(self.az, self.bz, self.ax, self.bx)
+        self.assertEqual(rz_hat.dtype, np.float32)
+        self._test_function_fft_reference(
+            channel, self.bz, self.bx, self.bz, rtol=1e-4
+        )
+
+    def test_copy(self):
+        channel = GradientChannel(self.shape)
+        channel.compute_backward_posterior(self.az, self.bz, self.ax, self.bx)
+        pickle.loads(pickle.dumps(channel))
+        # copies must not share the n_eff scratch buffer
+        channel_copy = copy.deepcopy(channel)
+        self.assertIsNot(channel_copy._n_eff_buffer, channel._n_eff_buffer)
+        self.assertEqual(
+            channel_copy.compute_n_eff(self.az, self.ax),
+            channel.compute_n_eff(self.az, self.ax)
+        )
+
+    def test_bz_mutated_in_place(self):
+        channel = GradientChannel(self.shape)
+        bz = self.bz.copy()
+        channel.compute_backward_mean(self.az, bz, self.ax, self.bx)
+        bz *= 2
+        rz = channel.compute_backward_mean(self.az, bz, self.ax, self.bx)
+        rz_fresh = GradientChannel(self.shape).compute_backward_mean(
+            self.az, bz, self.ax, self.bx
+        )
+        np.testing.assert_allclose(rz, rz_fresh, atol=1e-12)
+
+    @unittest.skipUnless(importlib.util.find_spec("cupy"), "cupy not installed")
+    def test_cupy_backend(self):
+        channel = GradientChannel(self.shape)
+        gpu_channel = GradientChannel(self.shape, backend="cupy")
+        args = (self.az, self.bz, self.ax, self.bx)
+        for method in ["compute_backward_mean", "compute_forward_mean"]:
+            r = getattr(channel, method)(*args)
+            r_gpu = getattr(gpu_channel, method)(*args)
+            self.assertIsInstance(r_gpu, np.ndarray)
+            np.testing.assert_allclose(r_gpu, r, atol=1e-12)
+        z = self.bz
+        np.testing.assert_allclose(
+            gpu_channel.convolve(z), channel.convolve(z), atol=1e-12
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -4,25 +4,37 @@ from tramp.likelihoods import (
 )
 from tramp.utils.misc import complex2array, array2complex
 import numpy as np
+import math
+from functools import partial
 
 
 def complex_dot(z1, z2):
     return np.real(np.conjugate(z1)*z2)
 
 
+# NOTE : the integrands are evaluated on scalars by quad, math.exp avoids
+# the numpy ufunc dispatch overhead on each call
+
+
+def real_belief(z, az, bz):
+    return math.exp(-0.5 * az * z * z + bz * z)
+
+
+def real_z_belief(z, az, bz):
+    return z * real_belief(z, az, bz)
+
+
+def real_z2_belief(z, az, bz):
+    return z * z * real_belief(z, az, bz)
+
+
 def explicit_real_integral(az, bz, y, likelihood):
     """
     Compute rz, vz for likelihood p(y|z) by integration for z real
     """
-    def belief(z):
-        L = -0.5 * az * (z**2) + bz * z
-        return np.exp(L)
-
-    def z_belief(z):
-        return z*belief(z)
-
-    def z2_belief(z):
-        return (z**2)*belief(z)
+    belief = partial(real_belief, az=az, bz=bz)
+    z_belief = partial(real_z_belief, az=az, bz=bz)
+    z2_belief = partial(real_z2_belief, az=az, bz=bz)
     Z = likelihood.measure(y, belief)
     rz = likelihood.measure(y, z_belief) / Z
     z2 = likelihood.measure(y, z2_belief) / Z
@@ -30,22 +42,32 @@ def explicit_real_integral(az, bz, y, likelihood):
     return rz, vz
 
 
+def complex_belief(z, az, bz):
+    L = -0.5 * az * (z.conjugate() * z).real + (bz.conjugate() * z).real
+    return math.exp(L)
+
+
+def complex_real_z_belief(z, az, bz):
+    return z.real * complex_belief(z, az, bz)
+
+
+def complex_imag_z_belief(z, az, bz):
+    return z.imag * complex_belief(z, az, bz)
+
+
+def complex_z2_belief(z, az, bz):
+    return (z.conjugate() * z).real * complex_belief(z, az, bz)
+
+
 def explicit_complex_integral(az, bz, y, likelihood):
     """
     Compute rz, vz for likelihood p(y|z) by integration for z complex
     """
-    def belief(z):
-        L = -0.5 * az * complex_dot(z, z) + complex_dot(bz, z)
-        return np.exp(L)
-
-    def real_z_belief(z):
-        return np.real(z)*belief(z)
-
-    def imag_z_belief(z):
-        return np.imag(z)*belief(z)
-
-    def z2_belief(z):
-        return complex_dot(z, z)*belief(z)
+    bz = complex(bz)
+    belief = partial(complex_belief, az=az, bz=bz)
+    real_z_belief = partial(complex_real_z_belief, az=az, bz=bz)
+    imag_z_belief = partial(complex_imag_z_belief, az=az, bz=bz)
+    z2_belief = partial(complex_z2_belief, az=az, bz=bz)
     Z = likelihood.measure(y, belief)
     real_rz = likelihood.measure(y, real_z_belief) / Z
     imag_rz = likelihood.measure(y, imag_z_belief) / Z